@@ -1,16 +1,75 @@
 from astrbot.api.event import filter, AstrMessageEvent, MessageEventResult
 from astrbot.api.star import Context, Star, register
 from astrbot.api import logger, AstrBotConfig
-from typing import Dict, Optional, Any
+from typing import Dict, Optional, Any, Tuple
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+import asyncio
+import importlib.util
 import json
+import re
+import time
 
 try:
-    from zai import ZhipuAiClient
-    ZHIPU_AVAILABLE = True
+    import orjson
+
+    def _dumps(obj: Any, indent: bool = False) -> str:
+        """使用orjson序列化为JSON字符串，非ASCII字符原样输出"""
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2 if indent else 0).decode("utf-8")
 except ImportError:
-    ZHIPU_AVAILABLE = False
+    def _dumps(obj: Any, indent: bool = False) -> str:
+        """orjson不可用时回退到标准库json"""
+        if indent:
+            return json.dumps(obj, ensure_ascii=False, indent=2)
+        return json.dumps(obj, ensure_ascii=False, separators=(",", ":"))
+
+# 仅检查SDK是否安装，实际导入延迟到创建客户端时，插件未配置时无需加载整个SDK依赖
+ZHIPU_AVAILABLE = importlib.util.find_spec("zai") is not None
+if not ZHIPU_AVAILABLE:
     logger.warning("zai-sdk 未安装，请运行 pip install zai-sdk>=0.0.3.3")
 
+def _clip(s: str, limit: int) -> str:
+    """按最大字符数截断内容，超出部分以省略号表示，limit为0时不截断"""
+    return s[:limit] + "…" if 0 < limit < len(s) else s
+
+def _normalize_query(query: str) -> str:
+    """归一化查询用于缓存匹配：转为小写并仅保留字母和数字"""
+    return "".join(ch for ch in query.lower() if ch.isalnum())
+
+# 同时执行的搜索请求线程数上限
+_SEARCH_WORKERS = 8
+
+# API错误码 -> (错误说明, 排查提示)
+_ERROR_TABLE = {
+    "401": ("API认证失败 (401)", "请检查：1) API Key是否正确 2) 账户余额是否充足 3) 是否开通了网络搜索功能"),
+    "403": ("API权限不足 (403)", "请检查账户是否开通了网络搜索功能"),
+    "429": ("API请求频率超限 (429)", ""),
+}
+
+# 异常未携带status_code时，从错误信息中匹配独立出现的状态码
+_STATUS_CODE_RE = re.compile(r"\b(401|403|429)\b")
+
+# 包裹搜索结果的提示，预先拆分为前后两段，调用时直接拼接
+_LLM_WRAPPER_PRE = "搜索完成！请根据以下搜索结果直接回答用户问题，不要再次搜索：\n\n"
+_LLM_WRAPPER_POST = "\n\n请立即基于上述搜索结果为用户提供完整的回答。"
+
+# /zhipu_config 输出模板，静态部分预先拼接
+_CONFIG_TEMPLATE = "\n".join([
+    "🔧 智谱AI搜索插件配置",
+    "=" * 35,
+    "API Key: {api_key}",
+    "默认搜索引擎: {engine}",
+    "默认结果数量: {count}",
+    "默认内容大小: {content_size}",
+    "LLM工具函数: {llm_tool}",
+    "智谱AI SDK: {sdk}",
+    "客户端状态: {client}",
+    "=" * 35,
+    "ℹ️  本插件仅支持LLM工具函数调用",
+    "当AI需要搜索信息时会自动触发",
+])
+
 @register(
     "astrbot_plugin_zhipu_search", 
     "PaloMiku", 
@@ -31,23 +90,77 @@ class ZhipuSearchPlugin(Star):
         super().__init__(context)
         self.config = config
         self.client = None
+        # 搜索结果缓存: 请求参数元组 -> (写入时间, 响应)，按LRU顺序淘汰
+        self._cache: OrderedDict[tuple, tuple[float, Any]] = OrderedDict()
+        # 进行中的搜索请求: 请求参数元组 -> Future，相同请求并发时共享同一次API调用
+        self._inflight: Dict[tuple, asyncio.Future] = {}
+        # /zhipu_config 输出文本缓存，客户端关闭时置空
+        self._config_text_cache: Optional[str] = None
+        # API认证失败后的熔断截止时间及原因，期间直接失败不再请求API
+        self._blocked_until = 0.0
+        self._block_reason = ""
+        # SDK为同步实现，搜索请求在独立的有界线程池中执行，避免阻塞事件循环或占满默认线程池。
+        # 搜索API每次请求仅支持一个查询，无法合并批量请求；不同查询并行执行并共用同一个客户端连接。
+        self._executor = ThreadPoolExecutor(max_workers=_SEARCH_WORKERS, thread_name_prefix="zhipu_search")
+        self._load_config()
+        self._init_client()
+        logger.info(
+            f"智谱AI搜索插件状态: SDK{'已安装' if ZHIPU_AVAILABLE else '未安装'}, "
+            f"API Key{'已配置' if self._api_key else '未配置'}, "
+            f"LLM工具函数{'已启用' if self._enable_llm_tool else '已禁用'}"
+        )
+
+    def _load_config(self) -> None:
+        """读取插件配置快照
+
+        配置在插件运行期间不变，缓存到实例属性上以避免每次调用重复查询。
+        AstrBot保存插件配置时会重新创建插件实例，快照随之刷新。
+        """
+        self._api_key = self.config.get("api_key", "")
+        self._enable_llm_tool = self.config.get("enable_llm_tool", True)
+        self._default_engine = self.config.get("default_search_engine", "search_pro")
+        self._default_count = self.config.get("default_count", 5)
+        self._default_content_size = self.config.get("default_content_size", "medium")
+        self._cache_ttl = self.config.get("cache_ttl_sec", 300)
+        self._cache_max = self.config.get("cache_max", 256)
+        self._pretty_json = self.config.get("debug_pretty_json", False)
+        self._max_content_chars = self.config.get("max_content_chars", 2000)
+        self._normalize_cache_query = self.config.get("cache_normalize_query", False)
+        self._auth_fail_block_sec = self.config.get("auth_fail_block_sec", 60)
+
+    def _init_client(self) -> None:
+        """根据当前配置创建智谱AI客户端
 
+        客户端内部持有带连接池的HTTP会话，所有工具调用共享同一实例以复用长连接。
+        """
         if not ZHIPU_AVAILABLE:
             logger.error("智谱AI SDK未安装，插件无法正常工作，请运行: pip install zai-sdk>=0.0.3.3")
             return
             
-        api_key = self.config.get("api_key", "")
-        if not api_key:
+        if not self._api_key:
             logger.warning("未配置智谱AI API Key，请在插件配置中设置")
             return
             
         try:
-            self.client = ZhipuAiClient(api_key=api_key)
+            from zai import ZhipuAiClient
+            self.client = ZhipuAiClient(api_key=self._api_key)
             logger.info("智谱AI搜索插件初始化成功")
         except Exception as e:
             logger.error(f"智谱AI客户端初始化失败: {e}")
             self.client = None
 
+    def _close_client(self) -> None:
+        """关闭当前客户端并释放其连接池"""
+        client, self.client = self.client, None
+        self._config_text_cache = None
+        close = getattr(client, "close", None)
+        if close is None:
+            return
+        try:
+            close()
+        except Exception as e:
+            logger.warning(f"智谱AI客户端关闭失败: {e}")
+
     async def _web_search(
         self, 
         query: str, 
@@ -71,47 +184,137 @@ class ZhipuSearchPlugin(Star):
             Any: 智谱AI搜索API响应结果 (WebSearchResp对象)
             
         Raises:
-            Exception: 当客户端未初始化或搜索请求失败时
+            Exception: 当客户端未初始化、API认证失败后处于暂停期或搜索请求失败时
         """
         if not self.client:
             raise Exception("智谱AI客户端未初始化，请检查API Key配置")
         
-        search_engine = search_engine or self.config.get("default_search_engine", "search_pro")
-        count = max(1, min(50, count or self.config.get("default_count", 5)))
-        content_size = content_size or self.config.get("default_content_size", "medium")
-        
+        search_engine = search_engine or self._default_engine
+        count = max(1, min(50, count or self._default_count))
+        content_size = content_size or self._default_content_size
+
+        # 开启查询归一化时，仅标点、空格或大小写不同的查询共用同一缓存条目
+        cache_query = (_normalize_query(query) or query) if self._normalize_cache_query else query
+        key = (cache_query, search_engine, count, search_domain_filter, search_recency_filter, content_size)
+        cached = self._cache_get(key)
+        if cached is not None:
+            logger.debug(f"命中搜索缓存: {query}")
+            return cached
+
+        if time.monotonic() < self._blocked_until:
+            raise Exception(self._block_reason)
+
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            logger.debug(f"复用进行中的搜索请求: {query}")
+            # shield避免某个等待者被取消时连带取消共享的Future
+            return await asyncio.shield(inflight)
+
+        fut = asyncio.get_running_loop().create_future()
+        self._inflight[key] = fut
         try:
             logger.debug(f"开始搜索: {query}, 引擎: {search_engine}, 数量: {count}")
-            response = self.client.web_search.web_search(
-                search_engine=search_engine,
-                search_query=query,
-                count=count,
-                search_domain_filter=search_domain_filter,
-                search_recency_filter=search_recency_filter,
-                content_size=content_size
+            response = await asyncio.get_running_loop().run_in_executor(
+                self._executor,
+                partial(
+                    self.client.web_search.web_search,
+                    search_engine=search_engine,
+                    search_query=query,
+                    count=count,
+                    search_domain_filter=search_domain_filter,
+                    search_recency_filter=search_recency_filter,
+                    content_size=content_size
+                )
             )
+            self._blocked_until = 0.0
+            self._cache_put(key, response)
+            if not fut.done():
+                fut.set_result(response)
             return response
+        except asyncio.CancelledError:
+            # 发起方被取消时，让其他等待者收到普通异常而非取消信号
+            if not fut.done():
+                fut.set_exception(Exception("搜索请求已被取消"))
+                fut.exception()
+            raise
         except Exception as e:
-            error_msg = str(e)
-            if "401" in error_msg:
-                logger.error(f"API认证失败 (401): {error_msg}")
-                logger.error("请检查：1) API Key是否正确 2) 账户余额是否充足 3) 是否开通了网络搜索功能")
-            elif "403" in error_msg:
-                logger.error(f"API权限不足 (403): {error_msg}")
-                logger.error("请检查账户是否开通了网络搜索功能")
-            elif "429" in error_msg:
-                logger.error(f"API请求频率超限 (429): {error_msg}")
-            else:
-                logger.error(f"搜索请求失败: {error_msg}")
+            if not fut.done():
+                fut.set_exception(e)
+                # 标记异常已被读取，避免无其他等待者时产生未处理异常警告
+                fut.exception()
+            code = self._log_api_error(e)
+            if code in ("401", "403") and self._auth_fail_block_sec > 0:
+                self._blocked_until = time.monotonic() + self._auth_fail_block_sec
+                self._block_reason = f"API认证或权限校验失败，{self._auth_fail_block_sec}秒内暂停搜索请求: {e}"
             raise
+        finally:
+            self._inflight.pop(key, None)
+
+    def _log_api_error(self, e: Exception) -> str:
+        """根据HTTP状态码记录搜索失败日志
 
-    def _format_search_results_for_llm(self, search_response) -> str:
+        优先读取SDK异常(APIStatusError)的status_code，否则从错误信息中匹配独立出现的状态码。
+
+        Args:
+            e: 搜索请求抛出的异常
+        Returns:
+            str: 状态码，无法确定时返回空字符串
+        """
+        error_msg = str(e)
+        status_code = getattr(e, "status_code", None)
+        if status_code is not None:
+            code = str(status_code)
+        else:
+            match = _STATUS_CODE_RE.search(error_msg)
+            code = match.group(1) if match else ""
+        title, hint = _ERROR_TABLE.get(code, ("搜索请求失败", ""))
+        logger.error(f"{title}: {error_msg}")
+        if hint:
+            logger.error(hint)
+        return code
+
+    def _cache_get(self, key: tuple) -> Any:
+        """从搜索缓存中读取未过期的响应
+        
+        Args:
+            key: 搜索请求参数元组
+        Returns:
+            Any: 缓存的搜索响应，未命中或已过期时返回None
+        """
+        entry = self._cache.get(key)
+        if entry is None:
+            return None
+        ts, response = entry
+        if time.monotonic() - ts >= self._cache_ttl:
+            del self._cache[key]
+            return None
+        self._cache.move_to_end(key)
+        return response
+
+    def _cache_put(self, key: tuple, response: Any) -> None:
+        """写入搜索缓存，超出容量时淘汰最久未使用的条目
+        
+        搜索均为只读请求，结果可安全复用。
+        
+        Args:
+            key: 搜索请求参数元组
+            response: 智谱AI搜索API响应结果
+        """
+        if self._cache_max <= 0 or self._cache_ttl <= 0:
+            return
+        self._cache[key] = (time.monotonic(), response)
+        self._cache.move_to_end(key)
+        while len(self._cache) > self._cache_max:
+            self._cache.popitem(last=False)
+
+    def _format_search_results_for_llm(self, search_response) -> Tuple[str, int]:
         """格式化搜索结果为LLM专用格式
         
         Args:
             search_response: 智谱AI搜索API响应结果
         Returns:
-            str: 结构化的JSON字符串，供LLM处理使用
+            Tuple[str, int]: 结构化的JSON字符串及结果条数。JSON供LLM处理使用，默认输出紧凑格式
+                以减少LLM输入token，开启debug_pretty_json时输出缩进格式便于调试
         """
 
         if hasattr(search_response, 'search_result'):
@@ -120,34 +323,38 @@ class ZhipuSearchPlugin(Star):
             results = search_response["search_result"]
         else:
             logger.warning(f"搜索响应格式不正确: {type(search_response)}")
-            return json.dumps({"error": "未找到搜索结果"}, ensure_ascii=False)
+            return _dumps({"error": "未找到搜索结果"}), 0
         if not results:
             logger.info("搜索返回空结果")
-            return json.dumps({"message": "未找到搜索结果"}, ensure_ascii=False)
-        structured_results = []
-        for i, result in enumerate(results, 1):
-
-            if hasattr(result, 'title'):
-                structured_result = {
+            return _dumps({"message": "未找到搜索结果"}), 0
+        limit = self._max_content_chars
+        # 同一响应中的结果类型一致，只需判断一次
+        if hasattr(results[0], 'title'):
+            structured_results = [
+                {
                     "序号": i,
-                    "标题": getattr(result, 'title', "") or "",
-                    "内容": getattr(result, 'content', "") or "",
-                    "来源": getattr(result, 'media', "") or "",
-                    "链接": getattr(result, 'link', "") or "",
-                    "发布时间": getattr(result, 'publish_date', "") or ""
+                    "标题": (getattr(result, 'title', None) or "").strip(),
+                    "内容": _clip((getattr(result, 'content', None) or "").strip(), limit),
+                    "来源": (getattr(result, 'media', None) or "").strip(),
+                    "链接": (getattr(result, 'link', None) or "").strip(),
+                    "发布时间": (getattr(result, 'publish_date', None) or "").strip()
                 }
-            else:
-                structured_result = {
+                for i, result in enumerate(results, 1)
+            ]
+        else:
+            structured_results = [
+                {
                     "序号": i,
-                    "标题": result.get("title", "").strip(),
-                    "内容": result.get("content", "").strip(),
-                    "来源": result.get("media", "").strip(),
-                    "链接": result.get("link", "").strip(),
-                    "发布时间": result.get("publish_date", "").strip()
+                    "标题": (result.get("title") or "").strip(),
+                    "内容": _clip((result.get("content") or "").strip(), limit),
+                    "来源": (result.get("media") or "").strip(),
+                    "链接": (result.get("link") or "").strip(),
+                    "发布时间": (result.get("publish_date") or "").strip()
                 }
-            structured_results.append(structured_result)
+                for i, result in enumerate(results, 1)
+            ]
         logger.info(f"成功格式化{len(structured_results)}条搜索结果")
-        return json.dumps(structured_results, ensure_ascii=False, indent=2)
+        return _dumps(structured_results, indent=self._pretty_json), len(structured_results)
 
     @filter.llm_tool(name="zhipu_web_search")
     async def llm_web_search_tool(
@@ -167,14 +374,11 @@ class ZhipuSearchPlugin(Star):
         Returns:
             MessageEventResult: 格式化的搜索结果，供LLM进一步处理
         """
-        if not self.config.get("enable_llm_tool", True):
+        if not self._enable_llm_tool:
             logger.warning("LLM搜索工具函数已被禁用")
             yield event.plain_result("搜索工具函数已被禁用")
             return
-        logger.info(f"ZHIPU_AVAILABLE: {ZHIPU_AVAILABLE}")
-        logger.info(f"client状态: {self.client is not None}")
-        api_key = self.config.get("api_key", "")
-        logger.info(f"API Key配置状态: {'已配置' if api_key else '未配置'}")
+        logger.debug(f"ZHIPU_AVAILABLE: {ZHIPU_AVAILABLE}, client状态: {self.client is not None}")
         if not ZHIPU_AVAILABLE:
             logger.error("智谱AI SDK未安装")
             yield event.plain_result("智谱AI SDK未安装，请运行: pip install zai-sdk>=0.0.3.3")
@@ -187,9 +391,12 @@ class ZhipuSearchPlugin(Star):
         logger.info(f"LLM工具函数被调用: 查询='{query}', 数量={count}")
         try:
             search_response = await self._web_search(query=query, count=count)
-            result_json = self._format_search_results_for_llm(search_response)
+            result_json, result_count = self._format_search_results_for_llm(search_response)
+            if not result_count:
+                yield event.plain_result("未找到相关搜索结果")
+                return
 
-            return_to_llm = f"搜索完成！请根据以下搜索结果直接回答用户问题，不要再次搜索：\n\n{result_json}\n\n请立即基于上述搜索结果为用户提供完整的回答。"
+            return_to_llm = _LLM_WRAPPER_PRE + result_json + _LLM_WRAPPER_POST
             yield return_to_llm
         except Exception as e:
             logger.error(f"LLM搜索工具执行失败: {e}")
@@ -200,35 +407,27 @@ class ZhipuSearchPlugin(Star):
         
         用于查看插件当前配置状态，包括API Key设置、搜索引擎配置等。
         """
-        config_info = [
-            "🔧 智谱AI搜索插件配置",
-            "=" * 35
-        ]
-        
-        api_key = self.config.get("api_key", "")
-        config_info.extend([
-            f"API Key: {'✅ 已设置' if api_key else '❌ 未设置'}",
-            f"默认搜索引擎: {self.config.get('default_search_engine', 'search_pro')}",
-            f"默认结果数量: {self.config.get('default_count', 5)}",
-            f"默认内容大小: {self.config.get('default_content_size', 'medium')}",
-            f"LLM工具函数: {'✅ 已启用' if self.config.get('enable_llm_tool', True) else '❌ 已禁用'}",
-            f"智谱AI SDK: {'✅ 已安装' if ZHIPU_AVAILABLE else '❌ 未安装'}",
-            f"客户端状态: {'✅ 已初始化' if self.client else '❌ 未初始化'}"
-        ])
-        
-        config_info.extend([
-            "=" * 35,
-            "ℹ️  本插件仅支持LLM工具函数调用",
-            "当AI需要搜索信息时会自动触发"
-        ])
-        
-        yield event.plain_result("\n".join(config_info))
+        if self._config_text_cache is not None:
+            yield event.plain_result(self._config_text_cache)
+            return
+
+        self._config_text_cache = _CONFIG_TEMPLATE.format(
+            api_key='✅ 已设置' if self._api_key else '❌ 未设置',
+            engine=self._default_engine,
+            count=self._default_count,
+            content_size=self._default_content_size,
+            llm_tool='✅ 已启用' if self._enable_llm_tool else '❌ 已禁用',
+            sdk='✅ 已安装' if ZHIPU_AVAILABLE else '❌ 未安装',
+            client='✅ 已初始化' if self.client else '❌ 未初始化',
+        )
+        yield event.plain_result(self._config_text_cache)
 
     async def terminate(self):
         """插件终止时的清理工作
         
-        释放客户端资源，记录插件停用日志。
+        关闭客户端连接池和搜索线程池，记录插件停用日志。
         """
-        if self.client:
-            self.client = None
+        self._close_client()
+        self._cache.clear()
+        self._executor.shutdown(wait=False)
         logger.info("智谱AI搜索插件已停用")